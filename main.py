@@ -1,12 +1,17 @@
+import asyncio
+import functools
 import logging
 import os
 import re
 import threading
 import time
-import requests
-from bs4 import BeautifulSoup
+from types import MappingProxyType
+import aiohttp
+import lxml.etree
+import lxml.html
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
+from fastapi.staticfiles import StaticFiles
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from playwright.sync_api import sync_playwright
 
@@ -17,9 +22,22 @@ log = logging.getLogger("worldboss")
 
 COOKIE = os.getenv("COOKIE", "").strip()
 UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-HEADERS = {"User-Agent": UA}
+# Headers figés : attachés une seule fois à la session aiohttp (voir fetch_boss_loop),
+# aucune requête ne les repasse ni ne les modifie
+_headers = {"User-Agent": UA}
 if COOKIE:
-    HEADERS["Cookie"] = COOKIE
+    _headers["Cookie"] = COOKIE
+HEADERS = MappingProxyType(_headers)
+
+DETAIL_TIMEOUT = aiohttp.ClientTimeout(total=8)
+LIST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+TELEGRAM_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# Cache des stats par ID de boss : (time.monotonic() du fetch, stats)
+_DETAIL_CACHE: dict[str, tuple[float, dict]] = {}
+_DETAIL_TTL = 3600
+_DETAIL_NEGATIVE_TTL = 60  # échecs / pages sans stats : on réessaie vite
+_DETAIL_CACHE_MAX = 256
 
 DUMP_HTML_ON_FAILURE = os.getenv("DUMP_HTML_ON_FAILURE", "0") not in {"0", "false", "False", ""}
 HTML_SNAPSHOT_PATH = os.getenv("HTML_SNAPSHOT_PATH", "/tmp/world_bosses.html")
@@ -30,26 +48,144 @@ TELEGRAM_ENABLED = bool(TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID)
 TELEGRAM_TEST_PING = os.getenv("TELEGRAM_TEST_PING", "0") not in {"0", "false", "False", ""}
 
 EXPEDITION_URL = "https://web.simple-mmo.com/quests"
+EXPEDITION_FIRST_BTN = "button[x-on\\:click*=\"set-expedition-data\"]"
+EXPEDITION_BTN = "button[x-on\\:click*=\"performExpedition\"]"
+EXPEDITION_COOLDOWN_S = 299  # attente max entre deux clics performExpedition
+# Vrai si le bouton existe et n'est pas désactivé
+_JS_BUTTON_ENABLED = "sel => { const b = document.querySelector(sel); return !!b && !b.disabled; }"
+
+# Chiffres ASCII uniquement (str.isdigit accepte aussi "²", que int() refuse)
+_DIGITS = frozenset("0123456789")
+
+# Expressions régulières compilées une seule fois
+_RE_BOSS_ID = re.compile(r"worldboss/view/(\d+)")
+_RE_HREF_WB = re.compile(r"/worldboss/view/\d+")
+_RE_TITLE = re.compile(rb"<title[^>]*>([^<]{0,200})</title>", re.IGNORECASE)
+# Tous les formats d'ETA dans une seule alternation, essayés dans le même ordre qu'avant.
+# Le groupe externe (dhm, hms, ...) se ferme en dernier : m.lastgroup donne le format reconnu.
+_RE_ETA = re.compile(
+    r"^(?:"
+    r"(?P<dhm>(?:(?P<dhm_d>\d+)\s*days?,\s*)?(?:(?P<dhm_h>\d+)\s*hours?,\s*)?(?:(?P<dhm_m>\d+)\s*mins?(?:ute)?s?)?)"
+    r"|(?P<hms>(?P<hms_h>\d{1,2}):(?P<hms_m>\d{2}):(?P<hms_s>\d{2}))"
+    r"|(?P<ms>(?P<ms_m>\d{1,2}):(?P<ms_s>\d{2}))"
+    r"|(?P<num_min>(?P<num_min_m>\d+)\s*(?:minutes?|mins?|m))"
+    r"|(?P<num_h_m>(?P<num_h_m_h>\d+)\s*heures?\s*(?P<num_h_m_m>\d+)?.*)"
+    r")$"
+)
+_STAT_KEYS = ("hp", "strength", "dexterity", "defence")
+# Une seule alternation : le groupe nommé qui matche indique la stat, un seul passage sur le texte
+_RE_STAT_LABELS = re.compile(
+    r"(?:(?P<hp>Health|Vie|HP)"
+    r"|(?P<strength>Strength|Force|STR)"
+    r"|(?P<dexterity>Dexterity|Dexterité|Dexterite|DEX)"
+    r"|(?P<defence>Defence|Defense|DEF))"
+    r"\s*:?\s*(?P<num>[0-9][0-9\s\u00A0'\.,]*)",
+    re.IGNORECASE,
+)
+
+# Préfixe du libellé <dt> (en minuscules) -> clé de stat
+_LABEL_MAP = {
+    "health": "hp",
+    "vie": "hp",
+    "strength": "strength",
+    "force": "strength",
+    "dexter": "dexterity",
+    "defence": "defence",
+    "defense": "defence",
+}
+
+
+def _cls(*names: str) -> str:
+    """Prédicat XPath équivalent au sélecteur CSS .a.b (tokens exacts de l'attribut class)."""
+    return " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {n} ')" for n in names)
+
+
+# Requêtes XPath compilées une seule fois (équivalents des anciens sélecteurs CSS)
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_XP_PAGE_TEXT = lxml.etree.XPath("//body//text()[not(ancestor::script) and not(ancestor::style)]")
+_XP_DL_DT = lxml.etree.XPath("//dl//dt")
+_XP_NEXT_CARD_CANDIDATES = (
+    lxml.etree.XPath(f"//div[{_cls('pointer-events-auto')}]//div[{_cls('border-indigo-400')}]"),
+    lxml.etree.XPath(f"//div[{_cls('w-full', 'bg-white', 'border-2', 'border-indigo-400')}]"),
+    lxml.etree.XPath(f"//div[{_cls('w-full', 'bg-white', 'border-2')}]"),
+    lxml.etree.XPath(f"//div[{_cls('w-full', 'bg-white')}]"),
+)
+_XP_NEXT_LINK = lxml.etree.XPath(".//a[contains(@href, 'worldboss/view')]")
+_XP_IMG = lxml.etree.XPath(".//img")
+_XP_OTHER_ROWS = lxml.etree.XPath(f"//div[{_cls('divide-y')}]//div[{_cls('flex', 'justify-between')}]")
+
+# Champs texte d'une carte/ligne : classes requises sur le <p>/<div> correspondant.
+# Résolus en un seul parcours des descendants (les classes Tailwind "sm:" n'ont pas besoin d'échappement).
+_NEXT_CARD_FIELDS = (
+    ("name", frozenset({"text-xs", "sm:text-sm", "font-medium", "text-gray-900"})),
+    ("level", frozenset({"text-xs", "sm:text-sm", "text-gray-500"})),
+    ("time", frozenset({"text-xs", "sm:text-sm", "text-gray-400"})),
+)
+_OTHER_ROW_FIELDS = (
+    ("name", frozenset({"font-bold"})),
+    ("level", frozenset({"text-gray-600", "font-normal"})),
+    ("time", frozenset({"text-xs", "sm:text-sm", "text-gray-500", "font-normal"})),
+)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+class CachedStaticFiles(StaticFiles):
+    """Fichiers statiques avec Cache-Control pour que le navigateur garde CSS/JS."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", "public, max-age=3600")
+        return response
+
 
 app = FastAPI()
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 
-def dump_html_snapshot(content: str, reason: str) -> None:
+def dump_html_snapshot(content: bytes, reason: str) -> None:
     if not DUMP_HTML_ON_FAILURE:
         return
     try:
-        with open(HTML_SNAPSHOT_PATH, "w", encoding="utf-8") as f:
+        # Octets bruts de la réponse : pas de décodage sur le chemin d'erreur
+        with open(HTML_SNAPSHOT_PATH, "wb") as f:
             f.write(content)
         log.info("Dump HTML -> %s (len=%s) reason=%s", HTML_SNAPSHOT_PATH, len(content), reason)
     except Exception:
         log.exception("Impossible d'écrire le snapshot HTML")
 
-def absolutize(src: str | None) -> str | None:
-    """Convertit un chemin relatif en URL absolue pour afficher correctement les icônes."""
+def icon_src(el: lxml.html.HtmlElement | None) -> str | None:
+    """URL absolue de l'icône d'un <img> (chemin relatif complété avec le domaine SimpleMMO)."""
+    src = el.get("src") if el is not None else None
     if not src:
         return None
-    if src.startswith("http://") or src.startswith("https://"):
-        return src
-    return "https://web.simple-mmo.com" + src
+    # Couvre http:// et https:// en une comparaison
+    return src if src[:4] == "http" else "https://web.simple-mmo.com" + src
+
+
+def first_match(xpath: lxml.etree.XPath, node) -> lxml.html.HtmlElement | None:
+    """Premier élément renvoyé par une XPath compilée (équivalent de select_one)."""
+    found = xpath(node)
+    return found[0] if found else None
+
+
+def match_fields(node: lxml.html.HtmlElement, tag: str, fields: tuple) -> dict[str, str | None]:
+    """Texte du premier descendant <tag> portant toutes les classes requises, pour chaque champ."""
+    found = {}
+    for el in node.iterdescendants(tag):
+        classes = el.get("class")
+        if not classes:
+            continue
+        tokens = set(classes.split())
+        for key, required in fields:
+            if key not in found and required <= tokens:
+                found[key] = el
+        if len(found) == len(fields):
+            break
+    return {key: node_text(found.get(key)) for key, _ in fields}
+
+
+def node_text(el: lxml.html.HtmlElement | None) -> str | None:
+    return el.text_content().strip() if el is not None else None
 
 
 def build_playwright_cookies(cookie_header: str) -> list[dict]:
@@ -78,54 +214,83 @@ def extract_boss_id(link: str | None) -> str | None:
     """Extrait l'ID numérique du boss depuis une URL /worldboss/view/<id>."""
     if not link:
         return None
-    m = re.search(r"worldboss/view/(\d+)", link)
+    m = _RE_BOSS_ID.search(link)
     return m.group(1) if m else None
 
 
-def fetch_boss_details(boss_id: str | None) -> dict:
-    """Récupère les stats du boss (HP, STR, DEX, DEF) via la page dédiée."""
+def format_spawn_at(eta_seconds: int | None, display_now: float) -> str | None:
+    """Heure de spawn estimée à partir de l'ETA, display_now incluant déjà le décalage +1h."""
+    if eta_seconds is None:
+        return None
+    return time.strftime("%H:%M:%S", time.localtime(display_now + eta_seconds))
+
+
+async def fetch_boss_details(session: aiohttp.ClientSession, boss_id: str | None) -> dict:
+    """Stats du boss avec cache TTL : elles ne changent pas pour un même ID."""
     if not boss_id:
         return {}
+    hit = _DETAIL_CACHE.get(boss_id)
+    if hit:
+        fetched_at, cached = hit
+        ttl = _DETAIL_TTL if any(v is not None for v in cached.values()) else _DETAIL_NEGATIVE_TTL
+        if time.monotonic() - fetched_at < ttl:
+            return cached
+
+    stats = await fetch_boss_details_uncached(session, boss_id)
+
+    # Réinsertion en fin de dict : l'ordre d'insertion suit l'âge des entrées
+    _DETAIL_CACHE.pop(boss_id, None)
+    if len(_DETAIL_CACHE) >= _DETAIL_CACHE_MAX:
+        del _DETAIL_CACHE[next(iter(_DETAIL_CACHE))]
+    _DETAIL_CACHE[boss_id] = (time.monotonic(), stats)
+    return stats
+
+
+async def fetch_boss_details_uncached(session: aiohttp.ClientSession, boss_id: str) -> dict:
+    """Récupère les stats du boss (HP, STR, DEX, DEF) via la page dédiée."""
     url = f"https://web.simple-mmo.com/worldboss/view/{boss_id}"
     try:
-        r = requests.get(url, headers=HEADERS, timeout=8)
-        if r.status_code != 200:
-            log.debug("Boss %s detail HTTP %s", boss_id, r.status_code)
-            return {}
-        soup = BeautifulSoup(r.text, "lxml")
+        async with session.get(url, timeout=DETAIL_TIMEOUT) as r:
+            if r.status != 200:
+                log.debug("Boss %s detail HTTP %s", boss_id, r.status)
+                return {}
+            body = await r.read()
+        root = lxml.html.document_fromstring(body, parser=_HTML_PARSER)
 
         def clean_num(val: str | None) -> int | None:
             if not val:
                 return None
-            digits = re.sub(r"[^0-9]", "", val)
+            digits = "".join(filter(_DIGITS.__contains__, val))
             return int(digits) if digits else None
 
         # Try structured scrape first: dt/dd pairs in the stats grid
         stats = {}
-        for dt in soup.select("dl dt"):
-            label = dt.get_text(strip=True).lower()
-            dd = dt.find_next_sibling("dd")
-            num = clean_num(dd.get_text(strip=True) if dd else None)
-            if label.startswith("health") or label.startswith("vie"):
-                stats.setdefault("hp", num)
-            elif label.startswith("strength") or label.startswith("force"):
-                stats.setdefault("strength", num)
-            elif label.startswith("dexterity") or label.startswith("dexter"):
-                stats.setdefault("dexterity", num)
-            elif label.startswith("defence") or label.startswith("defense"):
-                stats.setdefault("defence", num)
+        for dt in _XP_DL_DT(root):
+            label = dt.text_content().strip().lower()
+            # Le <dd> suit normalement directement le <dt> : getnext() suffit, sans parcours
+            dd = dt.getnext()
+            while dd is not None and dd.tag != "dd":
+                dd = dd.getnext()
+            key = next((k for prefix, k in _LABEL_MAP.items() if label.startswith(prefix)), None)
+            if key:
+                stats.setdefault(key, clean_num(node_text(dd)))
+
+        missing = {k for k in _STAT_KEYS if stats.get(k) is None}
+        if not missing:
+            return stats
 
         # Fallback: regex on page text
-        text = soup.get_text(" ", strip=True)
-
-        def grab(label: str) -> int | None:
-            m = re.search(rf"{label}\s*:?\s*([0-9][0-9\s\u00A0'\.,]*)", text, re.IGNORECASE)
-            return clean_num(m.group(1) if m else None)
-
-        stats.setdefault("hp", grab("Health|Vie|HP"))
-        stats.setdefault("strength", grab("Strength|Force|STR"))
-        stats.setdefault("dexterity", grab("Dexterity|Dexterité|Dexterite|DEX"))
-        stats.setdefault("defence", grab("Defence|Defense|DEF"))
+        text = " ".join(t.strip() for t in _XP_PAGE_TEXT(root) if t.strip())
+        for m in _RE_STAT_LABELS.finditer(text):
+            key = next(k for k in _STAT_KEYS if m.group(k) is not None)
+            if key in missing:
+                stats[key] = clean_num(m.group("num"))
+                missing.discard(key)
+                if not missing:
+                    break
+
+        for key in missing:
+            stats.setdefault(key, None)
 
         return stats
     except Exception:
@@ -133,48 +298,48 @@ def fetch_boss_details(boss_id: str | None) -> dict:
         return {}
 
 
-def scrape_bosses():
+async def scrape_bosses(session: aiohttp.ClientSession):
     url = "https://web.simple-mmo.com/battle/world-bosses"
-    r = requests.get(url, headers=HEADERS, timeout=10)
+    async with session.get(url, timeout=LIST_TIMEOUT) as r:
+        status = r.status
+        body = await r.read()
 
-    if r.status_code != 200:
-        log.error("HTTP %s sur %s", r.status_code, url)
-        dump_html_snapshot(r.text, "http-status-" + str(r.status_code))
+    if status != 200:
+        log.error("HTTP %s sur %s", status, url)
+        dump_html_snapshot(body, "http-status-" + str(status))
         return []
 
-    log.debug("GET %s -> %s, taille=%s", url, r.status_code, len(r.text))
+    log.debug("GET %s -> %s, taille=%s", url, status, len(body))
 
-    soup = BeautifulSoup(r.text, "lxml")
-
-    # Debug: vérifier si on est tombé sur une page de protection/login
-    page_title = (soup.title.string or "").strip() if soup.title else ""
+    # Vérifie sur le début du HTML si on est tombé sur une page de protection/login,
+    # avant de payer le parsing complet du document
+    m = _RE_TITLE.search(body, 0, 4096)
+    page_title = m.group(1).decode("utf-8", "replace").strip() if m else ""
     if page_title:
         log.debug("page title: %s", page_title)
     if "Just a moment" in page_title or "Cloudflare" in page_title or "login" in page_title.lower():
         log.warning("La page semble être protégée (title=%s). Un cookie/session ou un autre UA peut être nécessaire.", page_title)
+        dump_html_snapshot(body, "protected-page")
+        return []
 
-    bosses = []
+    root = lxml.html.document_fromstring(body, parser=_HTML_PARSER)
 
     # Prochain boss : carte avec bordure indigo (pointer-events-auto)
-    next_card = (
-        soup.select_one("div.pointer-events-auto div.border-indigo-400")
-        or soup.select_one("div.w-full.bg-white.border-2.border-indigo-400")
-        or soup.select_one("div.w-full.bg-white.border-2")
-        or soup.select_one("div.w-full.bg-white")
+    next_card = next(
+        (card for card in (first_match(xp, root) for xp in _XP_NEXT_CARD_CANDIDATES) if card is not None),
+        None,
     )
 
-    if next_card:
-        next_name_el = next_card.select_one("p.text-xs.sm\\:text-sm.font-medium.text-gray-900")
-        next_level_el = next_card.select_one("p.text-xs.sm\\:text-sm.text-gray-500")
-        next_time_el = next_card.select_one("p.text-xs.sm\\:text-sm.text-gray-400")
-        next_icon_el = next_card.select_one("img")
-        next_link_el = next_card.select_one("a[href*='worldboss/view']")
-
-        next_name = next_name_el.get_text(strip=True) if next_name_el else None
-        next_level = next_level_el.get_text(strip=True) if next_level_el else None
-        next_time = next_time_el.get_text(strip=True) if next_time_el else None
-        next_icon = absolutize(next_icon_el["src"] if next_icon_el and next_icon_el.has_attr("src") else None)
+    if next_card is not None:
+        next_link_el = first_match(_XP_NEXT_LINK, next_card)
+
+        fields = match_fields(next_card, "p", _NEXT_CARD_FIELDS)
+        next_name = fields["name"]
+        next_level = fields["level"]
+        next_time = fields["time"]
+        next_icon = icon_src(first_match(_XP_IMG, next_card))
     else:
+        next_link_el = None
         next_name = None
         next_level = None
         next_time = None
@@ -182,102 +347,60 @@ def scrape_bosses():
 
     log.debug(
         "next card found=%s name=%s level=%s time=%s icon=%s",
-        bool(next_card),
+        next_card is not None,
         next_name,
         next_level,
         next_time,
         bool(next_icon),
     )
 
-    next_id = extract_boss_id(next_link_el["href"] if next_link_el and next_link_el.has_attr("href") else None)
-    next_stats = fetch_boss_details(next_id)
-    next_eta_seconds = parse_eta_seconds(next_time)
-    spawn_at = None
-    if next_eta_seconds is not None:
-        spawn_at = time.strftime("%H:%M:%S", time.localtime(time.time() + next_eta_seconds + 3600))
+    next_id = extract_boss_id(next_link_el.get("href") if next_link_el is not None else None)
+    display_now = time.time() + 3600  # heures affichées en +1h
 
-    bosses.append({
+    bosses = [{
         "type": "next",
         "id": next_id,
         "name": next_name or "Inconnu",
         "level": next_level or "?",
         "time": next_time or "Actif",
-        "spawn_at": spawn_at,
+        "spawn_at": format_spawn_at(parse_eta_seconds(next_time), display_now),
         "icon": next_icon,
-        **next_stats,
-    })
-
-    # Autres bosses (6 entrées)
-    other_rows = soup.select("div.divide-y div.flex.justify-between")
-    other_names = []
-    other_levels = []
-    other_times = []
-    other_icons = []
-    other_details = []
-
-    for row in other_rows:
-        name_el = row.select_one("div.font-bold")
-        lvl_el = row.select_one("div.text-gray-600.font-normal")
-        time_el = row.select_one("div.text-xs.sm\\:text-sm.text-gray-500.font-normal")
-        img_el = row.select_one("img")
-        onclick = row.get("onclick", "")
-        href_match = re.search(r"/worldboss/view/\d+", onclick)
-        boss_link = href_match.group(0) if href_match else None
-        other_id = extract_boss_id(boss_link)
-        details = fetch_boss_details(other_id)
-        eta_label = time_el.get_text(strip=True) if time_el else None
-        eta_seconds = parse_eta_seconds(eta_label)
-        spawn_at = None
-        if eta_seconds is not None:
-            spawn_at = time.strftime("%H:%M:%S", time.localtime(time.time() + eta_seconds + 3600))
-
-        other_names.append(name_el.get_text(strip=True) if name_el else None)
-        other_levels.append(lvl_el.get_text(strip=True) if lvl_el else None)
-        other_times.append(eta_label)
-        other_icons.append(absolutize(img_el["src"] if img_el and img_el.has_attr("src") else None))
-        other_details.append({
-            "id": other_id,
-            "spawn_at": spawn_at,
-            **details,
+    }]
+
+    # Autres bosses (6 entrées) : un seul passage par ligne, un dict par boss
+    other_rows = _XP_OTHER_ROWS(root)
+    for row in other_rows[:6]:
+        href_match = _RE_HREF_WB.search(row.get("onclick", ""))
+        fields = match_fields(row, "div", _OTHER_ROW_FIELDS)
+        eta_label = fields["time"]
+        bosses.append({
+            "type": "other",
+            "name": fields["name"] or "Inconnu",
+            "level": fields["level"] or "?",
+            "time": eta_label or "Actif",
+            "icon": icon_src(first_match(_XP_IMG, row)),
+            "id": extract_boss_id(href_match.group(0) if href_match else None),
+            "spawn_at": format_spawn_at(parse_eta_seconds(eta_label), display_now),
         })
 
-    log.debug(
-        "other rows=%s names=%s levels=%s times=%s icons=%s",
-        len(other_rows),
-        len([n for n in other_names if n]),
-        len([l for l in other_levels if l]),
-        len([t for t in other_times if t]),
-        len([i for i in other_icons if i]),
-    )
+    log.debug("other rows=%s", len(other_rows))
 
-    count = min(len(other_rows), len(other_names), len(other_levels), len(other_times), len(other_icons), 6)
+    if not other_rows:
+        log.warning("Aucun boss 'other' trouvé")
+        dump_html_snapshot(body, "missing-other-nodes")
 
-    if count == 0:
-        log.warning(
-            "Aucun boss 'other' trouvé (names=%s levels=%s times=%s)",
-            len(other_names),
-            len(other_levels),
-            len(other_times),
-        )
-        dump_html_snapshot(r.text, "missing-other-nodes")
-
-    for i in range(count):
-        stats_payload = other_details[i] if i < len(other_details) else {}
-        bosses.append({
-            "type": "other",
-            "name": other_names[i] or "Inconnu",
-            "level": other_levels[i] or "?",
-            "time": other_times[i] or "Actif",
-            "icon": other_icons[i] if i < len(other_icons) else None,
-            **stats_payload,
-        })
+    # Récupère toutes les pages détail en parallèle
+    detail_ids = list(dict.fromkeys(b["id"] for b in bosses if b["id"]))
+    details = await asyncio.gather(*(fetch_boss_details(session, i) for i in detail_ids))
+    details_by_id = dict(zip(detail_ids, details))
+    for boss in bosses:
+        boss.update(details_by_id.get(boss["id"], {}))
 
     return bosses
 
-boss_state = {
-    "bosses": [],
-    "last_update": None
-}
+# Dernier scrap publié : (bosses, heure de mise à jour). Remplacé d'un bloc par
+# fetch_boss_cycle, lu d'un bloc par homepage() : jamais de lecture à moitié mise à jour.
+boss_snapshot: tuple[tuple[dict, ...], str | None] = ((), None)
 
 notify_state = {
     "key": None,
@@ -296,69 +419,72 @@ expedition_state = {
 }
 expedition_lock = threading.Lock()
 
-fetch_thread = None
+fetch_task = None
+telegram_task = None
+
+# File des messages Telegram : la boucle de scrap dépose, telegram_worker envoie
+telegram_queue: asyncio.Queue[str] = asyncio.Queue()
 
 
+@functools.lru_cache(maxsize=512)
 def parse_eta_seconds(label: str | None) -> int | None:
+    """ETA en secondes ; ne dépend que du libellé, d'où le cache (libellés répétés d'un cycle à l'autre)."""
     if not label:
         return None
-    lower = label.strip().lower()
-    norm = re.sub(r"\s+", " ", lower)
-    if "actif" in lower or "active" in lower:
+    norm = " ".join(label.lower().split())
+    if "actif" in norm or "active" in norm:
         return 0
 
-    dhm = re.match(
-        r"^(?:(\d+)\s*days?,\s*)?(?:(\d+)\s*hours?,\s*)?(?:(\d+)\s*mins?(?:ute)?s?)?$",
-        norm,
-    )
-    if dhm:
-        days = int(dhm.group(1) or 0)
-        hours = int(dhm.group(2) or 0)
-        minutes = int(dhm.group(3) or 0)
-        total = days * 86400 + hours * 3600 + minutes * 60
-        return total
-
-    hms = re.match(r"^(\d{1,2}):(\d{2}):(\d{2})$", lower)
-    if hms:
-        h, m, s = map(int, hms.groups())
-        return h * 3600 + m * 60 + s
+    m = _RE_ETA.match(norm)
+    if not m:
+        return None
+    return _ETA_HANDLERS[m.lastgroup](m)
 
-    ms = re.match(r"^(\d{1,2}):(\d{2})$", lower)
-    if ms:
-        m, s = map(int, ms.groups())
-        return m * 60 + s
 
-    num_min = re.match(r"^(\d+)\s*(minutes?|mins?|m)$", lower)
-    if num_min:
-        return int(num_min.group(1)) * 60
+def _group_int(m: re.Match, name: str) -> int:
+    return int(m.group(name) or 0)
 
-    num_h_m = re.match(r"^(\d+)\s*heures?\s*(\d+)?", lower)
-    if num_h_m:
-        hours = int(num_h_m.group(1))
-        minutes = int(num_h_m.group(2) or 0)
-        return hours * 3600 + minutes * 60
 
-    return None
+_ETA_HANDLERS = {
+    "dhm": lambda m: _group_int(m, "dhm_d") * 86400 + _group_int(m, "dhm_h") * 3600 + _group_int(m, "dhm_m") * 60,
+    "hms": lambda m: _group_int(m, "hms_h") * 3600 + _group_int(m, "hms_m") * 60 + _group_int(m, "hms_s"),
+    "ms": lambda m: _group_int(m, "ms_m") * 60 + _group_int(m, "ms_s"),
+    "num_min": lambda m: _group_int(m, "num_min_m") * 60,
+    "num_h_m": lambda m: _group_int(m, "num_h_m_h") * 3600 + _group_int(m, "num_h_m_m") * 60,
+}
 
 
-def send_telegram_message(text: str) -> None:
+async def send_telegram_message(session: aiohttp.ClientSession, text: str) -> None:
     if not TELEGRAM_ENABLED:
         log.debug("Telegram désactivé (token ou chat_id manquant)")
         return
     try:
-        resp = requests.post(
+        async with session.post(
             f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
             data={"chat_id": TELEGRAM_CHAT_ID, "text": text},
-            timeout=5,
-        )
-        if resp.status_code != 200:
-            log.warning("Telegram HTTP %s: %s", resp.status_code, resp.text[:200])
-        else:
-            log.info("Notification Telegram envoyée: %s", text)
+            timeout=TELEGRAM_TIMEOUT,
+        ) as resp:
+            if resp.status != 200:
+                body = await resp.text()
+                log.warning("Telegram HTTP %s: %s", resp.status, body[:200])
+            else:
+                log.info("Notification Telegram envoyée: %s", text)
     except Exception:
         log.exception("Echec envoi Telegram")
 
 
+async def telegram_worker():
+    """Envoie les messages de telegram_queue sans bloquer la boucle de scrap."""
+    # Session séparée : le cookie SimpleMMO ne doit pas partir vers api.telegram.org
+    async with aiohttp.ClientSession() as session:
+        while True:
+            text = await telegram_queue.get()
+            try:
+                await send_telegram_message(session, text)
+            finally:
+                telegram_queue.task_done()
+
+
 def format_alert_message(boss: dict, label: str) -> str:
     name = boss.get("name") or "?"
     level = boss.get("level") or "?"
@@ -366,53 +492,87 @@ def format_alert_message(boss: dict, label: str) -> str:
     return f"⚔️ Boss: {name}\n🏷️ Niveau: {level}\n⏳ Statut: {label}\n🕒 ETA: {eta}"
 
 
+def run_expedition_page(page) -> None:
+    """Ouvre la page des quêtes, clique sur l'expédition initiale puis relance performExpedition en boucle."""
+    page.goto(EXPEDITION_URL, wait_until="domcontentloaded")
+
+    first_btn = page.wait_for_selector(EXPEDITION_FIRST_BTN, state="visible", timeout=15000)
+    first_btn.click()
+    log.info("Expédition : premier bouton cliqué")
+
+    while expedition_state["active"]:
+        second_btn = page.wait_for_selector(EXPEDITION_BTN, state="visible", timeout=15000)
+        try:
+            second_btn.wait_for_element_state("enabled", timeout=5000)
+        except PlaywrightTimeoutError:
+            pass
+
+        try:
+            second_btn.click()
+            expedition_state["last_click"] = time.strftime("%H:%M:%S", time.localtime(time.time() + 3600))
+            log.info("Expédition : clic performExpedition")
+        except Exception as click_err:
+            log.warning("Expédition : clic impossible (%s)", click_err)
+
+        wait_for_expedition_cooldown(page)
+
+
+def wait_for_expedition_cooldown(page) -> None:
+    """Attend que le bouton performExpedition repasse de désactivé à actif (max EXPEDITION_COOLDOWN_S).
+
+    Vérifie chaque seconde, ce qui permet aussi à stop_expedition() de prendre effet en ~1s.
+    """
+    deadline = time.monotonic() + EXPEDITION_COOLDOWN_S
+    saw_disabled = False
+    while expedition_state["active"] and time.monotonic() < deadline:
+        if not page.evaluate(_JS_BUTTON_ENABLED, EXPEDITION_BTN):
+            saw_disabled = True
+        elif saw_disabled:
+            log.debug("Expédition : bouton de nouveau actif")
+            return
+        page.wait_for_timeout(1000)
+
+
 def expedition_loop():
-    """Boucle Playwright : clique sur l'expédition initiale puis toutes les 30s."""
+    """Boucle Playwright : le navigateur est lancé une fois, seule la page est recréée après une erreur."""
     while expedition_state["active"]:
         try:
             with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context()
-                cookies = build_playwright_cookies(COOKIE)
-                if cookies:
-                    context.add_cookies(cookies)
-                page = context.new_page()
-                page.goto(EXPEDITION_URL, wait_until="networkidle")
-
-                first_btn_selector = "button[x-on\\:click*=\"set-expedition-data\"]"
-                first_btn = page.wait_for_selector(first_btn_selector, state="visible", timeout=15000)
-                first_btn.click()
-                log.info("Expédition : premier bouton cliqué")
-
-                while expedition_state["active"]:
-                    second_btn_selector = "button[x-on\\:click*=\"performExpedition\"]"
-                    second_btn = page.wait_for_selector(second_btn_selector, state="visible", timeout=15000)
-                    try:
-                        second_btn.wait_for_element_state("enabled", timeout=5000)
-                    except PlaywrightTimeoutError:
-                        pass
-
+                browser = p.chromium.launch(
+                    headless=True,
+                    chromium_sandbox=False,
+                    args=["--disable-dev-shm-usage", "--disable-gpu"],
+                )
+                try:
+                    context = browser.new_context()
+                    cookies = build_playwright_cookies(COOKIE)
+                    if cookies:
+                        context.add_cookies(cookies)
+
+                    # Tant que le navigateur tient, une erreur ne coûte qu'une nouvelle page
+                    while expedition_state["active"] and browser.is_connected():
+                        page = context.new_page()
+                        try:
+                            run_expedition_page(page)
+                        except Exception as exc:
+                            expedition_state["last_error"] = str(exc)
+                            log.exception("Boucle expédition en erreur, nouvelle page dans 5s")
+                            time.sleep(5)
+                        finally:
+                            try:
+                                page.close()
+                            except Exception:
+                                log.debug("Fermeture de page Playwright échouée", exc_info=True)
+                finally:
                     try:
-                        second_btn.click()
-                        expedition_state["last_click"] = time.strftime("%H:%M:%S", time.localtime(time.time() + 3600))
-                        log.info("Expédition : clic performExpedition")
-                    except Exception as click_err:
-                        log.warning("Expédition : clic impossible (%s)", click_err)
-
-                    page.wait_for_timeout(299000)
+                        browser.close()
+                    except Exception:
+                        log.debug("Cleanup Playwright échoué", exc_info=True)
 
         except Exception as exc:
             expedition_state["last_error"] = str(exc)
-            log.exception("Boucle expédition en erreur, retry dans 5s")
+            log.exception("Navigateur Playwright en erreur, relance dans 5s")
             time.sleep(5)
-        finally:
-            try:
-                if 'context' in locals():
-                    context.close()
-                if 'browser' in locals():
-                    browser.close()
-            except Exception:
-                log.debug("Cleanup Playwright échoué", exc_info=True)
 
 
 def start_expedition() -> bool:
@@ -444,58 +604,72 @@ def expedition_status() -> dict:
         "last_error": expedition_state["last_error"],
     }
 
-def fetch_boss_loop():
-    while True:
-        try:
-            bosses = scrape_bosses()
-            boss_state["bosses"] = bosses
-            boss_state["last_update"] = time.strftime("%H:%M:%S", time.localtime(time.time() + 3600))
-            log.info("Bosses mis à jour (%s)", len(bosses))
-
-            if TELEGRAM_ENABLED and TELEGRAM_TEST_PING:
-                now_min = int(time.time() // 60)
-                if test_ping_state["last_min"] != now_min:
-                    send_telegram_message(f"[TEST] Ping {time.strftime('%H:%M:%S')}")
-                    test_ping_state["last_min"] = now_min
-
-            next_boss = bosses[0] if bosses else None
-            if next_boss:
-                eta_seconds = parse_eta_seconds(next_boss.get("time"))
-                key = f"{next_boss.get('name')}-{next_boss.get('level')}"
-
-                log.debug("Prochain boss=%s level=%s eta_label=%s eta_seconds=%s telegram=%s", next_boss.get("name"), next_boss.get("level"), next_boss.get("time"), eta_seconds, TELEGRAM_ENABLED)
-
-                if notify_state["key"] != key:
-                    notify_state["key"] = key
-                    notify_state["sent"] = set()
-
-                if eta_seconds is not None:
-                    checkpoints = [
-                        (3600, "1 heure"),
-                        (900, "15 minutes"),
-                        (120, "2 minutes"),
-                        (0, "Actif"),
-                    ]
-                    for threshold, label in checkpoints:
-                        if eta_seconds <= threshold and threshold not in notify_state["sent"]:
-                            send_telegram_message(format_alert_message(next_boss, label))
-                            notify_state["sent"].add(threshold)
-                else:
-                    log.debug("ETA non parsé, pas de notif Telegram")
-        except Exception as e:
-            log.exception("Erreur scraping")
-
-        time.sleep(30)
+async def fetch_boss_loop():
+    # Session partagée (keep-alive) pour web.simple-mmo.com
+    async with aiohttp.ClientSession(
+        headers=HEADERS,
+        connector=aiohttp.TCPConnector(limit=16),
+    ) as session:
+        while True:
+            await fetch_boss_cycle(session)
+            await asyncio.sleep(30)
+
+
+async def fetch_boss_cycle(session: aiohttp.ClientSession):
+    global boss_snapshot
+    try:
+        bosses = await scrape_bosses(session)
+        boss_snapshot = (tuple(bosses), time.strftime("%H:%M:%S", time.localtime(time.time() + 3600)))
+        log.info("Bosses mis à jour (%s)", len(bosses))
+
+        if TELEGRAM_ENABLED and TELEGRAM_TEST_PING:
+            now_min = int(time.time() // 60)
+            if test_ping_state["last_min"] != now_min:
+                telegram_queue.put_nowait(f"[TEST] Ping {time.strftime('%H:%M:%S')}")
+                test_ping_state["last_min"] = now_min
+
+        next_boss = bosses[0] if bosses else None
+        if next_boss:
+            eta_seconds = parse_eta_seconds(next_boss.get("time"))
+            key = f"{next_boss.get('name')}-{next_boss.get('level')}"
+
+            log.debug("Prochain boss=%s level=%s eta_label=%s eta_seconds=%s telegram=%s", next_boss.get("name"), next_boss.get("level"), next_boss.get("time"), eta_seconds, TELEGRAM_ENABLED)
+
+            if notify_state["key"] != key:
+                notify_state["key"] = key
+                notify_state["sent"] = set()
+
+            if eta_seconds is not None:
+                checkpoints = [
+                    (3600, "1 heure"),
+                    (900, "15 minutes"),
+                    (120, "2 minutes"),
+                    (0, "Actif"),
+                ]
+                # Tous les seuils franchis dans ce cycle partent dans un seul message
+                pending_alerts = [
+                    (threshold, label)
+                    for threshold, label in checkpoints
+                    if eta_seconds <= threshold and threshold not in notify_state["sent"]
+                ]
+                if pending_alerts:
+                    telegram_queue.put_nowait("\n\n".join(format_alert_message(next_boss, label) for _, label in pending_alerts))
+                    notify_state["sent"].update(threshold for threshold, _ in pending_alerts)
+            else:
+                log.debug("ETA non parsé, pas de notif Telegram")
+    except Exception as e:
+        log.exception("Erreur scraping")
 
 
 @app.on_event("startup")
-def start_background_fetch():
-    """Démarre la boucle de scrap en arrière-plan au lancement du serveur."""
-    global fetch_thread
-    if fetch_thread is None or not fetch_thread.is_alive():
-        fetch_thread = threading.Thread(target=fetch_boss_loop, daemon=True)
-        fetch_thread.start()
-        log.info("Thread fetch_boss_loop démarré")
+async def start_background_fetch():
+    """Démarre la boucle de scrap et l'envoi Telegram en arrière-plan au lancement du serveur."""
+    global fetch_task, telegram_task
+    if telegram_task is None or telegram_task.done():
+        telegram_task = asyncio.create_task(telegram_worker())
+    if fetch_task is None or fetch_task.done():
+        fetch_task = asyncio.create_task(fetch_boss_loop())
+        log.info("Tâche fetch_boss_loop démarrée")
 
 
 @app.post("/scraping/start")
@@ -514,9 +688,50 @@ def scraping_stop():
 def scraping_status():
     return expedition_status()
 
+# Page d'accueil : coquille statique construite une seule fois à l'import (CSS/JS servis par /static),
+# homepage() n'insère que les blocs dynamiques aux emplacements <!--SLOT-->.
+_HOMEPAGE_HEAD, _HOMEPAGE_MIDDLE, _HOMEPAGE_FOOT, _HOMEPAGE_TAIL = """
+    <!doctype html>
+    <html lang='fr'>
+    <head>
+        <meta charset='utf-8'>
+        <meta name='viewport' content='width=device-width, initial-scale=1'>
+        <title>World Bosses</title>
+        <link rel='icon' href='https://web.simple-mmo.com/img/simplemmo-trans.png'>
+        <link rel='stylesheet' href='/static/app.css'>
+        <script src='/static/app.js' defer></script>
+    </head>
+    <body>
+        <div class='page'>
+            <h1>World Bosses</h1>
+            <div class='next'>
+                <!--SLOT-->
+                <div><span class='tag'>Prochain</span></div>
+            </div>
+
+            <div class='controls'>
+                <button class='btn' id='btn-start'>Activer la fonction</button>
+                <button class='btn secondary' id='btn-stop'>Désactiver la fonction</button>
+                <span class='status' id='exp-status'>Statut : chargement…</span>
+            </div>
+            <div>
+                <span>Ceci est la fonction pour les quêtes automatiques.</span>
+            </div>
+            <h2>Autres boss</h2>
+            <div class='grid'>
+                <!--SLOT-->
+            </div>
+            <div class='foot'>Dernière mise à jour (+1h) : <!--SLOT--></div>
+        </div>
+    </body>
+    </html>
+    """.split("<!--SLOT-->")
+
+
 @app.get("/", response_class=HTMLResponse)
 def homepage():
-    if not boss_state["bosses"]:
+    bosses, last_update = boss_snapshot
+    if not bosses:
         return "<h1>Chargement des boss…</h1>"
 
     def img_tag(icon: str | None) -> str:
@@ -526,8 +741,8 @@ def homepage():
     def fmt_num(val) -> str:
         return f"{val:,}".replace(",", " ") if isinstance(val, int) else (val or "?")
 
-    next_boss = boss_state["bosses"][0]
-    other_bosses = boss_state["bosses"][1:]
+    next_boss = bosses[0]
+    other_bosses = bosses[1:]
 
     def stats_html(b: dict) -> str:
         hp = fmt_num(b.get("hp"))
@@ -554,88 +769,7 @@ def homepage():
         for b in other_bosses
     )
 
-    style = """
-            html, body { min-height: 100vh; height: 100%; overflow: hidden; }
-            :root {
-                --bg: #0f172a;
-                --card: #111827;
-                --card-2: #0b1224;
-                --text: #e5e7eb;
-                --muted: #9ca3af;
-                --accent: #7c3aed;
-                --accent-2: #22d3ee;
-            }
-            * { box-sizing: border-box; }
-            body { margin:0; font-family: 'Segoe UI', sans-serif; background: radial-gradient(circle at 20% 20%, #111827 0, #0b1224 35%, #0f172a 100%); color: var(--text); min-height: 100vh; height: 100%; overflow: hidden; }
-            .page { max-width: 1080px; margin: 0 auto; padding: 24px 16px 32px; min-height: 100vh; box-sizing: border-box; display: flex; flex-direction: column; gap: 16px; }
-            h1 { margin: 0 0 16px; font-size: 28px; letter-spacing: 0.3px; }
-            h2 { margin: 0 0 12px; font-size: 18px; color: var(--muted); font-weight: 600; }
-            .next { border: 1px solid rgba(124,58,237,.4); background: linear-gradient(135deg, rgba(124,58,237,.12), rgba(34,211,238,.08)); border-radius: 14px; padding: 18px; display: grid; grid-template-columns: auto 1fr auto; gap: 14px; align-items: center; box-shadow: 0 10px 30px rgba(0,0,0,.35); }
-            .avatar img { width: 72px; height: 72px; object-fit: contain; filter: drop-shadow(0 4px 8px rgba(0,0,0,.45)); }
-            .name { font-size: 20px; font-weight: 700; }
-            .meta { display: flex; gap: 10px; flex-wrap: wrap; margin-top: 4px; color: var(--muted); font-size: 14px; }
-            .pill { padding: 4px 10px; border-radius: 999px; background: rgba(124,58,237,.15); color: #c4b5fd; border: 1px solid rgba(124,58,237,.35); font-size: 13px; font-weight: 600; }
-            .time { color: #a5f3fc; font-weight: 600; font-size: 14px; }
-            .stats { margin-top: 4px; color: var(--muted); font-size: 13px; }
-            .spawn { margin-top: 4px; color: #c7d2fe; font-size: 13px; }
-            .grid { margin-top: 18px; display: grid; gap: 14px; grid-template-columns: repeat(auto-fit, minmax(240px, 1fr)); }
-            .card { background: var(--card); border: 1px solid rgba(255,255,255,.05); border-radius: 12px; padding: 14px; display: grid; grid-template-columns: auto 1fr; gap: 12px; align-items: center; box-shadow: 0 8px 24px rgba(0,0,0,.28); }
-            .card .avatar img { width: 52px; height: 52px; }
-            .foot { margin-top: 18px; color: var(--muted); font-size: 13px; text-align: right; }
-            .tag { display: inline-block; padding: 3px 8px; border-radius: 8px; background: rgba(34,211,238,.12); color: #67e8f9; border: 1px solid rgba(34,211,238,.35); font-size: 12px; font-weight: 600; }
-            .controls { display: flex; gap: 10px; align-items: center; margin-top: 12px; flex-wrap: wrap; }
-            .btn { background: var(--accent); color: #fff; border: none; padding: 8px 14px; border-radius: 10px; cursor: pointer; font-weight: 700; box-shadow: 0 6px 18px rgba(124,58,237,.35); transition: transform .08s ease, box-shadow .08s ease; }
-            .btn:hover { transform: translateY(-1px); box-shadow: 0 10px 24px rgba(124,58,237,.45); }
-            .btn.secondary { background: #1f2937; color: var(--text); border: 1px solid rgba(255,255,255,.12); box-shadow: none; }
-            .status { font-size: 13px; color: var(--muted); }
-    """
-
-    script = """
-        <script>
-        async function updateStatus() {
-            try {
-                const res = await fetch('/scraping/status');
-                const data = await res.json();
-                const statusEl = document.getElementById('exp-status');
-                const active = data.active ? 'Active' : 'Inactive';
-                const last = data.last_click ? `Dernier clic : ${data.last_click}` : '';
-                const err = data.last_error ? `Erreur : ${data.last_error}` : '';
-                statusEl.textContent = `Statut : ${active} ${last} ${err}`.trim();
-            } catch (e) {
-                document.getElementById('exp-status').textContent = 'Statut : erreur';
-            }
-        }
-
-        async function callEndpoint(url) {
-            await fetch(url, { method: 'POST' });
-            await updateStatus();
-        }
-
-        document.getElementById('btn-start').addEventListener('click', () => callEndpoint('/scraping/start'));
-        document.getElementById('btn-stop').addEventListener('click', () => callEndpoint('/scraping/stop'));
-
-        updateStatus();
-        setInterval(updateStatus, 15000);
-        </script>
-    """
-
-    html = f"""
-    <!doctype html>
-    <html lang='fr'>
-    <head>
-        <meta charset='utf-8'>
-        <meta name='viewport' content='width=device-width, initial-scale=1'>
-        <title>World Bosses</title>
-        <link rel='icon' href='https://web.simple-mmo.com/img/simplemmo-trans.png'>
-        <style>
-{style}
-        </style>
-    </head>
-    <body>
-        <div class='page'>
-            <h1>World Bosses</h1>
-            <div class='next'>
-                {img_tag(next_boss.get('icon'))}
+    next_html = f"""{img_tag(next_boss.get('icon'))}
                 <div>
                     <div class='name'>{next_boss.get('name') or 'Inconnu'}</div>
                     <div class='meta'>
@@ -644,27 +778,14 @@ def homepage():
                     </div>
                     <div class='stats'>{stats_html(next_boss)}</div>
                     <div class='spawn'>Spawn prévu : {next_boss.get('spawn_at') or 'En cours'} (ETA)</div>
-                </div>
-                <div><span class='tag'>Prochain</span></div>
-            </div>
-
-            <div class='controls'>
-                <button class='btn' id='btn-start'>Activer la fonction</button>
-                <button class='btn secondary' id='btn-stop'>Désactiver la fonction</button>
-                <span class='status' id='exp-status'>Statut : chargement…</span>
-            </div>
-            <div>
-                <span>Ceci est la fonction pour les quêtes automatiques.</span>
-            </div>
-            <h2>Autres boss</h2>
-            <div class='grid'>
-                {other_cards_html}
-            </div>
-            <div class='foot'>Dernière mise à jour (+1h) : {boss_state.get('last_update') or '...'}</div>
-        </div>
-        {script}
-    </body>
-    </html>
-    """
-
-    return html
+                </div>"""
+
+    return "".join((
+        _HOMEPAGE_HEAD,
+        next_html,
+        _HOMEPAGE_MIDDLE,
+        other_cards_html,
+        _HOMEPAGE_FOOT,
+        last_update or "...",
+        _HOMEPAGE_TAIL,
+    ))
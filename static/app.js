@@ -0,0 +1,24 @@
+async function updateStatus() {
+    try {
+        const res = await fetch('/scraping/status');
+        const data = await res.json();
+        const statusEl = document.getElementById('exp-status');
+        const active = data.active ? 'Active' : 'Inactive';
+        const last = data.last_click ? `Dernier clic : ${data.last_click}` : '';
+        const err = data.last_error ? `Erreur : ${data.last_error}` : '';
+        statusEl.textContent = `Statut : ${active} ${last} ${err}`.trim();
+    } catch (e) {
+        document.getElementById('exp-status').textContent = 'Statut : erreur';
+    }
+}
+
+async function callEndpoint(url) {
+    await fetch(url, { method: 'POST' });
+    await updateStatus();
+}
+
+document.getElementById('btn-start').addEventListener('click', () => callEndpoint('/scraping/start'));
+document.getElementById('btn-stop').addEventListener('click', () => callEndpoint('/scraping/stop'));
+
+updateStatus();
+setInterval(updateStatus, 15000);